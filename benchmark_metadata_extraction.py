@@ -0,0 +1,174 @@
+import json
+import os
+import glob
+import time
+
+from get_references_metadata_bfs import decode_json, extract_metadata_fields, extract_relevant_metadata, orjson
+
+
+def to_wos_response(metadata):
+
+    """
+    Rebuilds a WoS API response around the relevant metadata of a stored paper.
+    The seed_paper_*.json files only keep the extracted fields, so this puts them back
+    where extract_relevant_metadata expects to find them in a full record.
+
+    Parameters:
+    metadata (dict): The 'metadata' dictionary of a stored paper.
+
+    Returns:
+    dict: A response with the same layout as the one returned by fetch_metadata_uid_using_doi.
+    """
+
+    authors = [{'role': 'author', 'full_name': name, 'seq_no': i + 1} for i, name in enumerate(metadata['authors'])]
+    record = {
+        'UID': metadata['wos_id'],
+        'dynamic_data': {
+            'cluster_related': {
+                'identifiers': {
+                    'identifier': [{'type': 'issn', 'value': ''}, {'type': 'doi', 'value': metadata['doi']}]
+                }
+            }
+        },
+        'static_data': {
+            'summary': {
+                'titles': {'title': [{'type': 'source', 'content': metadata['publisher']},
+                                     {'type': 'item', 'content': metadata['title']}]},
+                'names': {'name': authors[0] if len(authors) == 1 else authors},
+                'doctypes': {'doctype': metadata['document_type']},
+                'publishers': {'publisher': {'names': {'name': {'full_name': metadata['publisher']}}}},
+                'pub_info': {'pubyear': metadata['publication_year'], 'coverdate': metadata['publication_date']}
+            },
+            'fullrecord_metadata': {
+                'abstracts': {'abstract': {'abstract_text': {'p': metadata['abstract']}}},
+                'keywords': {'keyword': metadata['keywords']}
+            }
+        }
+    }
+    return {'QueryResult': {'RecordsFound': 1}, 'Data': {'Records': {'records': {'REC': [record]}}}}
+
+
+def load_stored_metadata(file_paths):
+
+    """
+    Collects the metadata of every paper in the stored crawl outputs, including nested references.
+    """
+
+    all_metadata = []
+
+    def collect(papers):
+        for paper in papers:
+            all_metadata.append(paper['metadata'])
+            collect([reference for reference in paper.get('references', []) if isinstance(reference, dict)])
+
+    for file_path in file_paths:
+        with open(file_path) as f:
+            collect(json.load(f))
+    return all_metadata
+
+
+def get_summary(response):
+    return response['Data']['Records']['records']['REC'][0]['static_data']['summary']
+
+
+def set_single_title(response):
+    get_summary(response)['titles']['title'] = {'type': 'item', 'content': 'Single title'}
+
+
+def drop_author_role(response):
+    names = get_summary(response)['names']
+    names['name'] = [{'full_name': 'No role'}] + (names['name'] if isinstance(names['name'], list) else [names['name']])
+
+
+def set_keywords_null(response):
+    response['Data']['Records']['records']['REC'][0]['static_data']['fullrecord_metadata']['keywords'] = None
+
+
+def set_abstract_text_string(response):
+    response['Data']['Records']['records']['REC'][0]['static_data']['fullrecord_metadata']['abstracts'] = {
+        'abstract': {'abstract_text': 'Plain string abstract'}}
+
+
+def set_record_string(response):
+    response['Data']['Records']['records']['REC'][0] = 'not a record'
+
+
+# Record shapes that WoS can return besides the one built by to_wos_response.
+# Each entry gives the fields where extract_metadata_fields is expected to differ from extract_relevant_metadata:
+# the old function gives up on the whole record (or on all authors), the new one keeps every field it can read.
+SHAPE_VARIANTS = [
+    ("single 'title' dictionary", set_single_title, {'title', 'wos_id', 'doi', 'authors', 'abstract', 'keywords',
+                                                      'document_type', 'publisher', 'publication_year', 'publication_date'}),
+    ("'name' entry without 'role'", drop_author_role, {'authors'}),
+    ("'keywords' set to null", set_keywords_null, {'wos_id', 'doi', 'title', 'authors', 'abstract',
+                                                    'document_type', 'publisher', 'publication_year', 'publication_date'}),
+    ("'abstract_text' as a string", set_abstract_text_string, set()),
+    ("record that is not a dictionary", set_record_string, set()),
+]
+
+
+def compare_shape_variants(metadata):
+
+    """
+    Runs both extractors on unusual record shapes built from one stored paper.
+
+    Parameters:
+    metadata (dict): The 'metadata' dictionary of a stored paper.
+
+    Returns:
+    list: (description, differing fields, expected fields) for each entry of SHAPE_VARIANTS.
+    """
+
+    comparisons = []
+    for description, mutate, expected in SHAPE_VARIANTS:
+        response = to_wos_response(metadata)
+        mutate(response)
+        baseline = extract_relevant_metadata(response)
+        fast = extract_metadata_fields(response)
+        differing = {field for field in fast if fast[field] != baseline[field]}
+        comparisons.append((description, differing, expected))
+    return comparisons
+
+
+def time_extraction(responses, decode, extract, repeat=5):
+    # Best of several runs, to keep the comparison stable on a busy machine
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = [extract(decode(response)) for response in responses]
+        best = min(best, time.perf_counter() - start)
+    return best, results
+
+
+def main():
+
+    """
+    Times json + extract_relevant_metadata against decode_json + extract_metadata_fields
+    on the stored seed_paper_*.json records and compares their output. The stored records are well-formed,
+    so both should agree on all of them. On the unusual shapes in SHAPE_VARIANTS the outputs differ on purpose,
+    and the fields that differ are printed next to the expected ones.
+    """
+
+    file_paths = sorted(glob.glob(os.path.join('Metadata Fetcher', '*', 'seed_paper_*.json')))
+    responses = [json.dumps(to_wos_response(metadata)).encode() for metadata in load_stored_metadata(file_paths)]
+
+    baseline_time, baseline_results = time_extraction(responses, json.loads, extract_relevant_metadata)
+    fast_time, fast_results = time_extraction(responses, decode_json, extract_metadata_fields)
+    subset_time, _ = time_extraction(responses, decode_json, lambda metadata: extract_metadata_fields(metadata, ('doi', 'document_type')))
+    mismatches = sum(1 for baseline, fast in zip(baseline_results, fast_results) if baseline != fast)
+
+    print(f"Records: {len(responses)}")
+    print(f"json + extract_relevant_metadata: {baseline_time:.3f} s")
+    print(f"{'orjson' if orjson is not None else 'json'} + extract_metadata_fields: {fast_time:.3f} s")
+    print(f"Speedup: {baseline_time / fast_time:.1f}x")
+    print(f"Only doi and document_type: {subset_time:.3f} s")
+    print(f"Records with different output: {mismatches}")
+
+    print("Unusual record shapes (fields extracted differently / expected):")
+    for description, differing, expected in compare_shape_variants(load_stored_metadata(file_paths[:1])[0]):
+        status = "as expected" if differing == expected else "UNEXPECTED"
+        print(f"  {description}: {sorted(differing)} / {sorted(expected)} ({status})")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,127 @@ import json
 import requests
 import bibtexparser
 import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from tqdm.notebook import tqdm
 import os
 from datetime import datetime
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 current_time = datetime.now()
 
+
+def decode_json(content):
+    # orjson decodes the large WoS responses several times faster than json; fall back to json if it is not installed
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+class RateLimiter:
+
+    """
+    Spaces out API requests across all threads so the overall rate stays under the API limit.
+
+    Parameters:
+    requests_per_second (float): The maximum number of requests to send per second.
+    """
+
+    def __init__(self, requests_per_second):
+        self.interval = 1.0 / requests_per_second
+        self.lock = threading.Lock()
+        self.next_time = 0.0
+
+    def wait(self):
+        # Reserve the next free slot, then sleep outside the lock until it comes up
+        with self.lock:
+            now = time.monotonic()
+            wait_time = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+
+class VisitedRegistry:
+
+    """
+    Thread-safe record of the DOIs reached by every seed.
+    Each lookup (metadata of a DOI, references of a UID) is fetched from the API exactly once;
+    other seeds reaching the same DOI wait for that result instead of fetching it again.
+    Failed lookups (a None result or an exception) are not kept, so the next seed reaching the DOI tries again.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.results = {}
+        self.seeds = {}
+
+    def fetch_once(self, key, fetch_function, *args):
+        with self.lock:
+            future = self.results.get(key)
+            is_owner = future is None
+            if is_owner:
+                future = Future()
+                self.results[key] = future
+        if is_owner:
+            try:
+                result = fetch_function(*args)
+            except Exception as e:
+                print(f"\nError fetching {key}: {e}")
+                result = None
+            if result is None:
+                with self.lock:
+                    del self.results[key]
+            future.set_result(result)
+        return future.result()
+
+    def add_seed(self, doi, seed):
+        with self.lock:
+            self.seeds.setdefault(doi, set()).add(seed)
+
+
+# The WoS Expanded API allows 5 requests per second per API key, stay a little under it
+rate_limiter = RateLimiter(requests_per_second=4.5)
+
+
+def api_get(url, api_key, max_retries=5):
+
+    """
+    Sends a rate-limited GET request to the Web of Science API, retrying throttled (429),
+    server-side (5xx) and connection errors with exponential backoff.
+
+    Parameters:
+    url (str): The URL to request.
+    api_key (str): The API key for authenticating with the Web of Science API.
+    max_retries (int): How many times to retry a transient error.
+
+    Returns:
+    Response: The last response received, or None if the request never got one.
+    """
+
+    headers = {
+        'X-ApiKey': api_key
+    }
+    response = None
+    for attempt in range(max_retries + 1):
+        rate_limiter.wait()
+        try:
+            response = requests.get(url, headers=headers, timeout=60)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            print(f"\nRequest failed ({e}), attempt {attempt + 1}/{max_retries + 1}")
+            response = None
+        else:
+            if response.status_code != 429 and response.status_code < 500:
+                return response
+        if attempt < max_retries:
+            retry_after = response.headers.get('Retry-After', '') if response is not None else ''
+            time.sleep(float(retry_after) if retry_after.isdigit() else 2 ** attempt)
+    return response
+
 def fetch_metadata_uid_using_doi(doi, api_key):
     
     """
@@ -19,22 +134,23 @@ def fetch_metadata_uid_using_doi(doi, api_key):
 
     Returns:
     tuple: A tuple containing the metadata JSON response and the UID string.
+    Both are None if the request failed.
     """
 
     url = f"https://api.clarivate.com/api/wos?databaseId=WOK&usrQuery=DO=({doi})"
-    headers = {
-        'X-ApiKey': api_key
-    }
     # print("Current time from DOI:", datetime.now())
-    response = requests.get(url, headers=headers)
-    time.sleep(0.5)
+    response = api_get(url, api_key)
+    if response is None:
+        print(f"\nError fetching metadata for DOI {doi}: no response")
+        return None, None
     if response.status_code == 200:
-        # print(f'\nReceiving response for DOI {doi}:\n{response.json()}')
+        metadata = decode_json(response.content)
+        # print(f'\nReceiving response for DOI {doi}:\n{metadata}')
         uid = ''
-        if response.json()['QueryResult']['RecordsFound'] > 0:
-            uid = response.json()['Data']['Records']['records']['REC'][0]['UID']
+        if metadata['QueryResult']['RecordsFound'] > 0:
+            uid = metadata['Data']['Records']['records']['REC'][0]['UID']
             # print('UID : ', uid.replace(':', '%3A'))
-        return response.json(), uid.replace(':', '%3A').replace('(', '%28').replace(')', '%29')
+        return metadata, uid.replace(':', '%3A').replace('(', '%28').replace(')', '%29')
 
     else:
         print(f"\nError fetching metadata for DOI {doi}: {response.status_code}")
@@ -52,7 +168,7 @@ def fetch_references_using_uid(uid, api_key):
     api_key (str): The API key for authenticating with the Web of Science API.
 
     Returns:
-    Dictionary: A dictionary of references. 
+    Dictionary: A dictionary of references, or None if a page could not be fetched.
     List of references can be accessed using the 'Data' key in the Dictionary.
     """
 
@@ -62,14 +178,13 @@ def fetch_references_using_uid(uid, api_key):
 
     while True:
         url = f"https://api.clarivate.com/api/wos/references?databaseId=WOK&uniqueId={uid}&count={count}&firstRecord={first_index}"
-        headers = {
-            'X-ApiKey': api_key
-        }
         # print("Current time from Reference:", datetime.now())
-        response = requests.get(url, headers=headers)
-        time.sleep(0.5)
+        response = api_get(url, api_key)
+        if response is None:
+            print(f"\nError fetching references for UID {uid}: no response")
+            return None
         if response.status_code == 200:
-            references = response.json()
+            references = decode_json(response.content)
             all_references['Data'].extend(references['Data'])
             all_references['QueryResult'] = references['QueryResult']
             records_found = references.get('QueryResult', {}).get('RecordsFound', 0)
@@ -79,7 +194,7 @@ def fetch_references_using_uid(uid, api_key):
         else:
             print(f"\nError fetching references for UID {uid}: {response.status_code}")
             print("Response Content:", response.content)
-            break
+            return None
     # print(f'\nReceiving references for UID {uid}:\n{all_references}\n')
     return all_references
 
@@ -241,11 +356,190 @@ def extract_relevant_metadata(metadata):
             'publication_date': ''
         }
 
-    
+
+
+def compile_path(path):
+
+    """
+    Compiles a dotted path such as 'static_data.summary.pub_info' into an accessor function.
+    The accessor returns None as soon as a key is missing or a level is not a dictionary.
+
+    Parameters:
+    path (str): Keys separated by dots.
+
+    Returns:
+    function: A function taking a WoS record and returning the value at the path.
+    """
+
+    keys = tuple(path.split('.'))
+
+    def accessor(record):
+        value = record
+        try:
+            for key in keys:
+                value = value[key]
+        except (KeyError, TypeError):
+            return None
+        return value
+
+    return accessor
+
+
+def as_list(value):
+    # WoS returns a single dictionary instead of a one-element list when there is only one entry
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return value
+    return [value]
+
+
+get_identifiers = compile_path('dynamic_data.cluster_related.identifiers.identifier')
+get_titles = compile_path('static_data.summary.titles.title')
+get_names = compile_path('static_data.summary.names.name')
+get_abstracts = compile_path('static_data.fullrecord_metadata.abstracts.abstract')
+get_keywords = compile_path('static_data.fullrecord_metadata.keywords.keyword')
+get_doctypes = compile_path('static_data.summary.doctypes.doctype')
+get_publisher_name = compile_path('static_data.summary.publishers.publisher.names.name.full_name')
+get_pub_year = compile_path('static_data.summary.pub_info.pubyear')
+get_cover_date = compile_path('static_data.summary.pub_info.coverdate')
+
+
+def extract_doi(record):
+    for identifier in as_list(get_identifiers(record)):
+        if isinstance(identifier, dict) and identifier.get('type') == 'doi':
+            return identifier.get('value', '')
+    return ''
+
+
+def extract_title(record):
+    for title in as_list(get_titles(record)):
+        if isinstance(title, dict) and title.get('type') == 'item':
+            return title.get('content', '')
+    return ''
+
+
+def extract_authors(record):
+    return [name.get('full_name', '') for name in as_list(get_names(record))
+            if isinstance(name, dict) and name.get('role') == 'author']
+
+
+def extract_abstract(record):
+    for abstract in as_list(get_abstracts(record)):
+        abstract_text = abstract.get('abstract_text') if isinstance(abstract, dict) else None
+        if isinstance(abstract_text, dict):
+            text = abstract_text.get('p', '')
+            if text:
+                return text
+    return ''
+
+
+# Field name -> (extractor, default). Only the requested fields are ever looked at.
+FIELD_EXTRACTORS = {
+    'wos_id': (compile_path('UID'), ''),
+    'doi': (extract_doi, ''),
+    'title': (extract_title, ''),
+    'authors': (extract_authors, []),
+    'abstract': (extract_abstract, ''),
+    'keywords': (get_keywords, []),
+    'document_type': (get_doctypes, []),
+    'publisher': (get_publisher_name, ''),
+    'publication_year': (get_pub_year, ''),
+    'publication_date': (get_cover_date, '')
+}
+
+RELEVANT_FIELDS = tuple(FIELD_EXTRACTORS)
+
+
+def extract_metadata_fields(metadata, fields=RELEVANT_FIELDS):
+
+    """
+    Faster replacement for extract_relevant_metadata that only extracts the requested fields.
+    Well-formed records give the same output as extract_relevant_metadata. Where a record has an
+    unexpected shape, each field falls back to its own default instead of the whole record:
+        - a single 'title' dictionary instead of a list: the title is still extracted
+          (extract_relevant_metadata returns every field empty)
+        - a 'name' entry without 'role': the other authors are still extracted
+          (extract_relevant_metadata returns no authors)
+        - 'keywords' (or another container) set to null: only that field is empty
+          (extract_relevant_metadata returns every field empty)
+    An unexpected shape never raises; the field gets its default value.
+
+    Parameters:
+    metadata (dict): All metadata for a specific article obtained from WoS.
+    fields (tuple): Names of the fields to extract, see FIELD_EXTRACTORS.
+
+    Returns:
+    dict: A dictionary with the requested fields, empty values for fields that are missing.
+    """
+
+    try:
+        record = metadata['Data']['Records']['records']['REC'][0]
+        if not isinstance(record, dict):
+            raise TypeError(f"record is a {type(record).__name__}")
+    except (KeyError, IndexError, TypeError) as e:
+        print(f"Error extracting metadata: {e}")
+        record = None
+
+    extracted = {}
+    for field in fields:
+        extractor, default = FIELD_EXTRACTORS[field]
+        value = None
+        if record is not None:
+            try:
+                value = extractor(record)
+            except Exception as e:
+                print(f"Error extracting {field}: {e}")
+        if value is None:
+            value = list(default) if isinstance(default, list) else default
+        extracted[field] = value
+    return extracted
+
+
+def fetch_relevant_metadata(doi, api_key):
+
+    """
+    Fetches the metadata of a DOI and keeps only the relevant fields.
+
+    Parameters:
+    doi (str): The DOI of the paper to fetch metadata for.
+    api_key (str): The API key for authenticating with the Web of Science API.
+
+    Returns:
+    tuple: The relevant metadata dictionary (None if the DOI was not found) and the UID string.
+    None if the request failed.
+    """
+
+    metadata, uid = fetch_metadata_uid_using_doi(doi, api_key)
+    if uid is None:
+        return None
+    if not uid:
+        return None, uid
+    return extract_metadata_fields(metadata), uid
+
+
+def fetch_reference_dois(uid, api_key):
+
+    """
+    Fetches the references of a UID and returns their DOIs.
+
+    Parameters:
+    uid (str): The UID of the paper to fetch references for.
+    api_key (str): The API key for authenticating with the Web of Science API.
+
+    Returns:
+    list: A list of DOIs of the paper's references, or None if the request failed.
+    """
+
+    references = fetch_references_using_uid(uid, api_key)
+    if references is None:
+        return None
+    return extract_dois(references)
+
 
 from collections import deque
 
-def process_papers(papers, api_key, depth, visited_dois):
+def process_papers(papers, api_key, depth, visited_dois, registry=None, seed=None):
     """
     Processes a list of papers to fetch their metadata and references up to a specified depth using a breadth-first approach.
 
@@ -254,6 +548,9 @@ def process_papers(papers, api_key, depth, visited_dois):
     api_key (str): The API key for authenticating with the Web of Science API.
     depth (int): The maximum depth to fetch references.
     visited_dois (set): A set to keep track of visited DOIs to avoid re-fetching.
+    registry (VisitedRegistry): Registry shared with other seeds crawled at the same time, if any.
+        Papers already fetched for another seed are taken from it instead of the API.
+    seed (int): The seed number the papers are attributed to in the registry.
 
     Returns:
     list: A list of processed paper data, each containing metadata and references.
@@ -288,24 +585,29 @@ def process_papers(papers, api_key, depth, visited_dois):
                 visited_dois.add(paper_doi)
 
                 # Fetch metadata and UID for the paper
-                metadata, uid = fetch_metadata_uid_using_doi(paper_doi, api_key)
+                if registry is not None:
+                    registry.add_seed(paper_doi, seed)
+                    result = registry.fetch_once(('metadata', paper_doi), fetch_relevant_metadata, paper_doi, api_key)
+                else:
+                    result = fetch_relevant_metadata(paper_doi, api_key)
+                filtered_metadata, uid = result if result is not None else (None, None)
                 if uid:
-                    filtered_metadata = extract_relevant_metadata(metadata)
-
                     # If we are at max depth, don't fetch references
                     if current_depth >= depth:
                         references = []
                     else:
-                        # Fetch references using UID
-                        references_data = fetch_references_using_uid(uid, api_key)
-                        
-                        # Extract DOIs of references and add them to the queue for the next level (depth + 1)
-                        # references = []
-                        if references_data:
-                            reference_dois = extract_dois(references_data)
-                            references = reference_dois
-                            for ref_doi in reference_dois:
-                                queue.append((ref_doi, current_depth + 1))  # Add references to queue for next depth level
+                        # Fetch references using UID and extract their DOIs
+                        if registry is not None:
+                            reference_dois = registry.fetch_once(('references', uid), fetch_reference_dois, uid, api_key)
+                        else:
+                            reference_dois = fetch_reference_dois(uid, api_key)
+                        if reference_dois is None:
+                            reference_dois = []  # Kept as a paper without references; the error was printed above
+
+                        # Add them to the queue for the next level (depth + 1)
+                        references = reference_dois
+                        for ref_doi in reference_dois:
+                            queue.append((ref_doi, current_depth + 1))  # Add references to queue for next depth level
 
                     processed_papers.append({
                         'doi': paper_doi,
@@ -392,11 +694,13 @@ def display_statistics(all_papers_data):
     
 
 
-def main(visited_dois=set()):
+def main():
 
     """
     Main function to load seed papers from a BibTeX file, process them to fetch metadata and references,
     and save the results to a JSON file.
+    All seeds are crawled at the same time and share one VisitedRegistry, so a DOI reached from several
+    seeds is fetched once but still appears in the results of every one of them.
     """
 
     with open('seedPapers.bib') as bibtex_file:
@@ -411,19 +715,30 @@ def main(visited_dois=set()):
     folder_path = 'social_unrest_metadata_depth3_bfs'
     os.makedirs(folder_path, exist_ok=True)
 
-    for i in range(len(papers)): # len(papers)
-        seed_paper_data = process_papers(papers[i:i+1], api_key, depth, visited_dois) ######
+    registry = VisitedRegistry()
+    print_lock = threading.Lock()
+
+    def crawl_seed(i):
+        seed_paper_data = process_papers(papers[i:i+1], api_key, depth, set(), registry, seed=i+1)
         file_name = os.path.join(folder_path, f"seed_paper_{i+1}.json")
         with open(file_name, 'w') as f:
             json.dump(seed_paper_data, f, indent=4)
-        print(f"Seed Paper : {i+1}/16")
-        display_statistics(seed_paper_data)
-        
-    return visited_dois
+        with print_lock:
+            print(f"Seed Paper : {i+1}/{len(papers)}")
+            display_statistics(seed_paper_data)
+
+    with ThreadPoolExecutor(max_workers=len(papers)) as executor:
+        for future in [executor.submit(crawl_seed, i) for i in range(len(papers))]:
+            future.result()
+
+    # Every seed that reached each DOI
+    doi_seeds = {doi: sorted(seeds) for doi, seeds in registry.seeds.items()}
+    with open(os.path.join(folder_path, "doi_seeds.json"), 'w') as f:
+        json.dump(doi_seeds, f, indent=4)
+
+    return registry
         
 
 if __name__ == "__main__":
-    visited_dois_set = main()
-    # print(len(visited_dois_set))
-    # visited_dois_set = main(visited_dois_set)
-    # print(len(visited_dois_set))
+    registry = main()
+    # print(len(registry.seeds))
@@ -0,0 +1,303 @@
+import json
+import os
+import sys
+import zlib
+import glob
+import tracemalloc
+import multiprocessing
+
+
+def intern_value(value):
+    # Dates are usually strings such as 'JAN 2021' but can come back from WoS as plain numbers
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def compress_text(value):
+    # Titles and abstracts are unique text, so pooling cannot help them. Keep them zlib-compressed
+    # when that is smaller; short titles often are not. A few abstracts come back as lists and are kept as is.
+    if not isinstance(value, str) or not value:
+        return value
+    encoded = value.encode('utf-8')
+    compressed = zlib.compress(encoded, 9)
+    return compressed if len(compressed) < len(encoded) else value
+
+
+def decompress_text(value):
+    return zlib.decompress(value).decode('utf-8') if isinstance(value, bytes) else value
+
+
+class StringPool:
+
+    """
+    Stores every distinct string once and hands out small integer ids for it.
+    Author names, publishers, keywords and document types repeat thousands of times
+    across a crawl, so records keep the ids instead of their own copies of the strings.
+    """
+
+    __slots__ = ('values', 'ids')
+
+    def __init__(self):
+        self.values = []
+        self.ids = {}
+
+    def add(self, value):
+        # A few keywords come back as {'lang_id': ..., 'content': ...} dictionaries instead of strings
+        key = tuple(sorted(value.items())) if isinstance(value, dict) else value
+        string_id = self.ids.get(key)
+        if string_id is None:
+            string_id = len(self.values)
+            self.ids[key] = string_id
+            self.values.append(value)
+        return string_id
+
+    def add_all(self, values):
+        # WoS returns a bare string instead of a list when there is a single value, keep that shape
+        if isinstance(values, str):
+            return self.add(values)
+        return tuple(self.add(value) for value in values)
+
+    def lookup(self, string_ids):
+        if isinstance(string_ids, int):
+            return self.values[string_ids]
+        return [self.values[string_id] for string_id in string_ids]
+
+    def __len__(self):
+        return len(self.values)
+
+
+class PaperRecord:
+
+    """
+    Compact replacement for one {'doi', 'metadata', 'references'} paper dictionary.
+    Pooled fields (authors, keywords, document_types, publisher) hold ids into the StringPools of the PaperTable.
+    title and abstract may hold zlib-compressed bytes, use PaperTable.to_dict to read them back.
+    """
+
+    __slots__ = ('doi', 'wos_id', 'metadata_doi', 'title', 'abstract', 'authors', 'keywords',
+                 'document_types', 'publisher', 'publication_year', 'publication_date', 'references')
+
+    def __init__(self, doi, wos_id, metadata_doi, title, abstract, authors, keywords,
+                 document_types, publisher, publication_year, publication_date, references):
+        self.doi = doi
+        self.wos_id = wos_id
+        self.metadata_doi = metadata_doi
+        self.title = title
+        self.abstract = abstract
+        self.authors = authors
+        self.keywords = keywords
+        self.document_types = document_types
+        self.publisher = publisher
+        self.publication_year = publication_year
+        self.publication_date = publication_date
+        self.references = references
+
+
+class PaperTable:
+
+    """
+    All papers of one or more crawls, keyed by DOI, with shared string pools.
+    A paper reached from several seeds is only stored once.
+    """
+
+    def __init__(self):
+        self.authors = StringPool()
+        self.publishers = StringPool()
+        self.keywords = StringPool()
+        self.document_types = StringPool()
+        self.papers = {}
+
+    def add_paper(self, paper):
+
+        """
+        Adds a paper dictionary as written by process_papers and returns its record.
+        Papers already in the table are not added again.
+
+        Parameters:
+        paper (dict): A paper with 'doi', 'metadata' and 'references' keys.
+        References may be DOI strings (BFS output) or nested paper dictionaries (recursive output).
+
+        Returns:
+        PaperRecord: The record stored for the paper's DOI.
+        """
+
+        doi = sys.intern(paper.get('doi', ''))
+        references = []
+        for reference in paper.get('references', []):
+            if isinstance(reference, dict):
+                references.append(self.add_paper(reference).doi)
+            else:
+                references.append(sys.intern(reference))
+
+        record = self.papers.get(doi)
+        if record is not None:
+            # The same paper can be met at max depth (no references) and again closer to a seed
+            if references and not record.references:
+                record.references = tuple(references)
+            return record
+
+        metadata = paper.get('metadata', {})
+        record = PaperRecord(
+            doi=doi,
+            wos_id=metadata.get('wos_id', ''),
+            metadata_doi=metadata.get('doi', ''),
+            title=compress_text(metadata.get('title', '')),
+            abstract=compress_text(metadata.get('abstract', '')),
+            authors=self.authors.add_all(metadata.get('authors', [])),
+            keywords=self.keywords.add_all(metadata.get('keywords', [])),
+            document_types=self.document_types.add_all(metadata.get('document_type', [])),
+            publisher=self.publishers.add(metadata.get('publisher', '')),
+            publication_year=metadata.get('publication_year', ''),
+            publication_date=intern_value(metadata.get('publication_date', '')),
+            references=tuple(references)
+        )
+        self.papers[doi] = record
+        return record
+
+    def to_dict(self, record):
+
+        """
+        Rebuilds the original paper dictionary for a record, with references as DOI strings.
+
+        Parameters:
+        record (PaperRecord): A record of this table.
+
+        Returns:
+        dict: A dictionary with the same 'doi', 'metadata' and 'references' layout as the crawl output.
+        """
+
+        return {
+            'doi': record.doi,
+            'metadata': {
+                'wos_id': record.wos_id,
+                'doi': record.metadata_doi,
+                'title': decompress_text(record.title),
+                'authors': self.authors.lookup(record.authors),
+                'abstract': decompress_text(record.abstract),
+                'keywords': self.keywords.lookup(record.keywords),
+                'document_type': self.document_types.lookup(record.document_types),
+                'publisher': self.publishers.values[record.publisher],
+                'publication_year': record.publication_year,
+                'publication_date': record.publication_date
+            },
+            'references': list(record.references)
+        }
+
+    def __len__(self):
+        return len(self.papers)
+
+    def __iter__(self):
+        return iter(self.papers.values())
+
+
+def load_paper_table(file_paths, table=None):
+
+    """
+    Loads one or more seed_paper_*.json crawl outputs into a PaperTable.
+
+    Parameters:
+    file_paths (list): Paths of the JSON files to load.
+    table (PaperTable): An existing table to add the papers to. A new one is created if not given.
+
+    Returns:
+    PaperTable: The table holding every paper of the given files.
+    """
+
+    if table is None:
+        table = PaperTable()
+    for file_path in file_paths:
+        with open(file_path) as f:
+            papers = json.load(f)
+        for paper in papers:
+            table.add_paper(paper)
+    return table
+
+
+def load_paper_dicts(file_paths):
+
+    """
+    Loads the same files as plain dictionaries, the way the rest of the repository holds them.
+    Used as the baseline when measuring memory.
+    """
+
+    papers = []
+    for file_path in file_paths:
+        with open(file_path) as f:
+            papers.extend(json.load(f))
+    return papers
+
+
+def load_unique_paper_dicts(file_paths):
+
+    """
+    Loads the same papers as load_paper_table, still as plain dictionaries: one dictionary per DOI,
+    nested references flattened to DOI strings. Compared with the PaperTable, this isolates what the
+    records and string pools save from what deduplicating papers by DOI saves.
+    """
+
+    papers = {}
+
+    def add(paper):
+        references = [add(reference) if isinstance(reference, dict) else reference
+                      for reference in paper.get('references', [])]
+        doi = paper.get('doi', '')
+        if doi not in papers:
+            papers[doi] = {'doi': doi, 'metadata': paper.get('metadata', {}), 'references': references}
+        elif references and not papers[doi]['references']:
+            papers[doi]['references'] = references
+        return doi
+
+    for paper in load_paper_dicts(file_paths):
+        add(paper)
+    return papers
+
+
+def measure_memory(load_function, file_paths):
+
+    """
+    Measures how much memory the result of a loader keeps alive.
+
+    Parameters:
+    load_function (function): load_paper_table, load_paper_dicts or load_unique_paper_dicts.
+    file_paths (list): Paths of the JSON files to load.
+
+    Returns:
+    int: Number of bytes still allocated after loading.
+    """
+
+    tracemalloc.start()
+    result = load_function(file_paths)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return current
+
+
+def main():
+
+    """
+    Loads all stored crawl outputs both ways and prints the memory used by each.
+    """
+
+    file_paths = sorted(glob.glob(os.path.join('Metadata Fetcher', '*', 'seed_paper_*.json')))
+
+    # Each loader is measured in a fresh process so that one measurement cannot skew the next
+    # (e.g. through the interned string table left behind by an earlier load)
+    with multiprocessing.get_context('spawn').Pool(1, maxtasksperchild=1) as pool:
+        dict_bytes = pool.apply(measure_memory, (load_paper_dicts, file_paths))
+        unique_dict_bytes = pool.apply(measure_memory, (load_unique_paper_dicts, file_paths))
+        table_bytes = pool.apply(measure_memory, (load_paper_table, file_paths))
+    table = load_paper_table(file_paths)
+
+    print(f"Files loaded: {len(file_paths)}")
+    print(f"Unique papers: {len(table)}")
+    print(f"Distinct authors: {len(table.authors)}, publishers: {len(table.publishers)}, "
+          f"keywords: {len(table.keywords)}, document types: {len(table.document_types)}")
+    print(f"Nested dictionaries, every copy: {dict_bytes / 2**20:.2f} MiB")
+    print(f"Dictionaries, one per DOI: {unique_dict_bytes / 2**20:.2f} MiB")
+    print(f"Compact records: {table_bytes / 2**20:.2f} MiB")
+    print(f"Reduction from the records, string pools and compressed text: {1 - table_bytes / unique_dict_bytes:.1%}")
+    print(f"Reduction including DOI deduplication: {1 - table_bytes / dict_bytes:.1%}")
+
+
+if __name__ == "__main__":
+    main()